@@ -1,18 +1,31 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import numpy as np
 import io
 import time
 import plotly.express as px
-from streamlit_autorefresh import st_autorefresh
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import logging
 import re  # 追加：表示文字列から数値を抽出するため
+import orjson
 import datetime
-import pytz
+import threading
+import bisect
+import hashlib
+import heapq
+import itertools
+import collections
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
 
 
 # 日本時間で「今日の日付」を取得
-JST = pytz.timezone("Asia/Tokyo")
+JST = ZoneInfo("Asia/Tokyo")
 today = datetime.datetime.now(JST).date()
 
 
@@ -24,11 +37,77 @@ st.set_page_config(
 )
 
 HEADERS = {"User-Agent": "Mozilla/5.0"}
-JST = pytz.timezone('Asia/Tokyo')
 ROOM_LIST_URL = "https://mksoul-pro.com/showroom/file/room_list.csv"  #認証用
 BACKUP_INDEX_URL = "https://mksoul-pro.com/showroom/file/sr-event-archive-list-index.txt" # バックアップインデックスURL
 # 固定ファイルURLを定義
 BACKUP_FILE_URL = "https://mksoul-pro.com/showroom/file/sr-event-archive.csv"
+# 共有スレッドプールのワーカー数（プロセス全体。複数セッションの取得が互いに待たされない程度に確保する）
+FETCH_POOL_WORKERS = 64
+# 1回の並列取得（ページ一覧の取得や、1セッションの1回の更新）で SHOWROOM API に同時に投げるリクエスト数の上限
+FETCH_MAX_CONCURRENCY = 10
+# イベント一覧 API を一度に並列取得するページ数（空ページが無ければ次のまとまりを取得）
+EVENT_PAGE_BATCH = 5
+# リアルタイムダッシュボード（fragment）の自動更新間隔（秒）
+DASHBOARD_REFRESH_SECONDS = 7
+# 終了済みイベントのダッシュボードの自動更新間隔（秒）。配信中ルームのギフト履歴のため停止はしない
+DASHBOARD_REFRESH_SECONDS_ENDED = 30
+# 集計完了済み（順位・ポイント確定）イベントの最終ランキングを使い回す秒数
+FINAL_RANKING_TTL_SECONDS = 1800
+# 配信中ルーム一覧（onlives）を全セッションで使い回す秒数
+ONLIVES_TTL_SECONDS = 5
+# 条件付き GET（ETag / Last-Modified）で保持する URL 数の上限（超えたら一度クリアする）
+CONDITIONAL_GET_STORE_MAX = 1024
+# ギフトリストを使い回す秒数と、保持するルーム数・内容の種類の上限
+# （ギフトの品揃えは配信中にほぼ変わらないため長めに保持する）
+GIFT_LIST_TTL_SECONDS = 600
+GIFT_LIST_POOL_MAX = 1024
+# ルームごとにセッションで保持するギフトログの最大件数（履歴カードには保持分をすべて描画する）
+GIFT_LOG_CACHE_MAX = 500
+# スペシャルギフト履歴のハイライト（合計ポイントがしきい値以上なら、対応するクラスを付ける）
+GIFT_HIGHLIGHT_THRESHOLDS = (10000, 30000, 60000, 100000, 300000)
+GIFT_HIGHLIGHT_CLASSES = ("",) + tuple(f"highlight-{threshold}" for threshold in GIFT_HIGHLIGHT_THRESHOLDS)
+# 順位ごとの表示色（Plotly のデフォルトカラー。呼び出しのたびに px.colors から引き直さない）
+RANK_COLORS = tuple(px.colors.qualitative.Plotly)
+
+# スペシャルギフト履歴セクションの CSS（毎回の再描画で文字列を組み立て直さないようモジュール定数にする）
+GIFT_HISTORY_CSS = """
+<style>
+.container-wrapper { display: flex; flex-wrap: wrap; gap: 15px; }
+.room-container {
+    position: relative; width: 163px; flex-shrink: 0; border: 1px solid #ddd; border-radius: 5px;
+    padding: 10px; height: 500px; display: flex; flex-direction: column; padding-top: 30px; margin-top: 16px;
+    margin-bottom: 16px;
+}
+.ranking-label {
+    position: absolute; top: -12px; left: 50%; transform: translateX(-50%); padding: 2px 8px;
+    border-radius: 12px; color: white; font-weight: bold; font-size: 0.9rem; z-index: 10;
+    white-space: nowrap; box-shadow: 0 2px 5px rgba(0,0,0,0.2);
+}
+.room-title {
+    text-align: center; font-size: 1rem; font-weight: bold; margin-bottom: 10px; display: -webkit-box;
+    -webkit-line-clamp: 3; -webkit-box-orient: vertical; overflow: hidden; white-space: normal;
+    line-height: 1.4em; min-height: calc(1.4em * 3);
+}
+.gift-list-container { flex-grow: 1; height: 400px; overflow-y: scroll; scrollbar-width: auto; }
+.gift-item { display: flex; flex-direction: column; padding: 8px 8px; border-bottom: 1px solid #eee; gap: 4px; }
+.gift-item:last-child { border-bottom: none; }
+.gift-header { font-weight: bold; }
+.gift-info-row { display: flex; align-items: center; gap: 8px; flex-wrap: wrap; }
+.gift-image { width: 30px; height: 30px; border-radius: 5px; object-fit: contain; }
+.highlight-10000 { background-color: #ffe5e5; } .highlight-30000 { background-color: #ffcccc; }
+.highlight-60000 { background-color: #ffb2b2; } .highlight-100000 { background-color: #ff9999; }
+.highlight-300000 { background-color: #ff7f7f; }
+</style>
+"""
+
+# ステータス表セクションの CSS（見出しの余白調整と、集計中ポイントも含めたセルの右寄せ）
+STATUS_TABLE_CSS = """
+<style>
+h3.custom-status-title { padding-top: 0 !important; padding-bottom: 0px !important; margin: 0 !important; }
+div[data-testid="stDataFrame"] td { text-align: right !important; }
+div[data-testid="stDataFrame"] th { text-align: center !important; }
+</style>
+"""
 
 if "authenticated" not in st.session_state:  #認証用
     st.session_state.authenticated = False  #認証用
@@ -37,6 +116,118 @@ if "authenticated" not in st.session_state:  #認証用
 
 # ▼▼▼ ここから修正・追加した関数群 ▼▼▼
 
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    """
+    SHOWROOM API 用の共有 requests.Session（プロセスにつき1つ）
+    keep-alive で接続を使い回し、毎回の TCP / TLS ハンドシェイクを省く
+    一時的な 502 / 503 / 504 は短いバックオフで再試行する
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def _json(response):
+    """レスポンス本文を orjson でデコードする（失敗時は orjson.JSONDecodeError）"""
+    return orjson.loads(response.content)
+
+
+@st.cache_resource(show_spinner=False)
+def get_conditional_get_store():
+    """
+    条件付き GET 用の {url: (ETag, Last-Modified, デコード済み JSON, 本文のダイジェスト)}（プロセスにつき1つ、全セッションで共有）
+    """
+    return {}
+
+
+def get_json_conditional_with_digest(url, timeout):
+    """
+    get_json_conditional と同じだが、(デコード済み JSON, 受信した本文の blake2b ダイジェスト) を返す
+    - ダイジェストは受信したバイト列から求める（304 の場合は前回保存したものを返す）ため、JSON を再シリアライズしない
+    """
+    store = get_conditional_get_store()
+    cached = store.get(url)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, _, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    response = get_http_session().get(url, timeout=timeout, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached[2], cached[3]
+    response.raise_for_status()
+    data = _json(response)
+    digest = hashlib.blake2b(response.content, digest_size=8).digest()
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if etag or last_modified:
+        if len(store) >= CONDITIONAL_GET_STORE_MAX:
+            store.clear()
+        store[url] = (etag, last_modified, data, digest)
+    return data, digest
+
+
+def get_json_conditional(url, timeout):
+    """
+    前回の ETag / Last-Modified を付けて GET し、デコード済み JSON を返す（スレッドプールからも呼ばれる）
+    - 304 Not Modified なら前回の JSON をそのまま返し、本文の転送とデコードを省く
+    - 検証子を返さない API では通常の GET と同じ
+    - 戻り値は共有されるため、呼び出し側で変更しないこと
+    """
+    return get_json_conditional_with_digest(url, timeout)[0]
+
+
+@st.cache_resource(show_spinner=False)
+def get_fetch_executor():
+    """
+    ルーム単位の API 取得を並列に実行する共有スレッドプール（プロセスにつき1つ）
+    ワーカーでは st.* を呼べないため、投入する関数はエラーを戻り値で返すこと
+    """
+    return ThreadPoolExecutor(max_workers=FETCH_POOL_WORKERS, thread_name_prefix="showroom-fetch")
+
+
+def make_fetch_submitter(limit=FETCH_MAX_CONCURRENCY):
+    """
+    共有スレッドプールへの投入関数 submit(fn, *args) -> Future を返す
+    - 同じ submit から投入したもののうち、同時に実行中となるのは limit 件まで（超える分は投入時に空きを待つ）
+    - 待つのは投入する側（メインスレッド）なので、プールのワーカーを待ちで塞がない
+    """
+    executor = get_fetch_executor()
+    semaphore = threading.Semaphore(limit)
+
+    def submit(fn, *args):
+        semaphore.acquire()
+        future = executor.submit(fn, *args)
+        future.add_done_callback(lambda _: semaphore.release())
+        return future
+
+    return submit
+
+
+def fetch_map(fn, *iterables, limit=FETCH_MAX_CONCURRENCY):
+    """
+    executor.map と同様に fn を共有スレッドプールで並列に実行し、結果を入力順に返すジェネレータ
+    - 投入済みで結果を受け取っていないものは limit 件まで。1件受け取るごとに次の1件を投入する
+    - 途中で打ち切られたら（break など）、まだ始まっていない投入済みの分は取り消す
+    """
+    executor = get_fetch_executor()
+    args_iter = zip(*iterables)
+    pending = collections.deque(executor.submit(fn, *args) for args in itertools.islice(args_iter, limit))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for args in itertools.islice(args_iter, 1):
+                pending.append(executor.submit(fn, *args))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
 def normalize_event_id(val):
     """
     event_idを統一された文字列形式に正規化します。
@@ -51,48 +242,56 @@ def normalize_event_id(val):
         # 変換に失敗した場合は、そのままの文字列として扱う
         return str(val).strip()
 
-@st.cache_data(ttl=3600)
+def _fetch_event_page(url):
+    """イベント検索 API の1ページ分のイベントリストを取得（スレッドプールから呼ばれる）"""
+    response = get_http_session().get(url, timeout=5)
+    response.raise_for_status()
+    data = _json(response)
+
+    if isinstance(data, dict):
+        if 'events' in data:
+            return data['events']
+        elif 'event_list' in data:
+            return data['event_list']
+    elif isinstance(data, list):
+        return data
+    return []
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
 def get_api_events(status, pages=10):
     """
     APIから指定されたステータスのイベントを取得する汎用関数
+    - ページは EVENT_PAGE_BATCH 件ずつ並列に取得し、ページ順に空ページが出るまで取り込む
+    - 次のまとまりは、直前のまとまりに空ページが無かった場合だけ取得する
     """
     api_events = []
-    page = 1
-    for _ in range(pages):
-        url = f"https://www.showroom-live.com/api/event/search?status={status}&page={page}"
-        try:
-            response = requests.get(url, headers=HEADERS, timeout=5)
-            response.raise_for_status()
-            data = response.json()
+    try:
+        for batch_start in range(1, pages + 1, EVENT_PAGE_BATCH):
+            page_urls = [
+                f"https://www.showroom-live.com/api/event/search?status={status}&page={page}"
+                for page in range(batch_start, min(batch_start + EVENT_PAGE_BATCH, pages + 1))
+            ]
+            reached_end = False
+            for page_events in fetch_map(_fetch_event_page, page_urls):
+                if not page_events:
+                    reached_end = True
+                    break
 
-            page_events = []
-            if isinstance(data, dict):
-                if 'events' in data:
-                    page_events = data['events']
-                elif 'event_list' in data:
-                    page_events = data['event_list']
-            elif isinstance(data, list):
-                page_events = data
-
-            if not page_events:
+                filtered_page_events = [
+                    event for event in page_events 
+                    if event.get("show_ranking") is not False or event.get("type_name") == "ランキング"
+                ]
+                api_events.extend(filtered_page_events)
+            if reached_end:
                 break
-
-            filtered_page_events = [
-                event for event in page_events 
-                if event.get("show_ranking") is not False or event.get("type_name") == "ランキング"
-            ]
-            api_events.extend(filtered_page_events)
-            page += 1
-        except requests.exceptions.RequestException as e:
-            st.error(f"イベントデータ取得中にエラーが発生しました (status={status}): {e}")
-            break
-        except ValueError:
-            st.error(f"APIからのJSONデコードに失敗しました: {response.text}")
-            break
+    except requests.exceptions.RequestException as e:
+        st.error(f"イベントデータ取得中にエラーが発生しました (status={status}): {e}")
+    except ValueError as e:
+        st.error(f"APIからのJSONデコードに失敗しました: {e}")
     return api_events
 
 
-@st.cache_data(ttl=3600)
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
 def get_backup_events(start_date, end_date):
     """
     固定バックアップファイルから指定された期間の終了イベントを取得する関数
@@ -106,7 +305,7 @@ def get_backup_events(start_date, end_date):
     ]
 
     try:
-        response = requests.get(BACKUP_FILE_URL, headers=HEADERS, timeout=10)
+        response = get_http_session().get(BACKUP_FILE_URL, timeout=10)
         response.raise_for_status()
         csv_data = response.content.decode("utf-8-sig")
         df = pd.read_csv(io.StringIO(csv_data), dtype=str)
@@ -133,8 +332,8 @@ def get_backup_events(start_date, end_date):
     df.drop_duplicates(subset=['event_id'], keep='first', inplace=True)
 
     # 日付範囲フィルタ（JST）
-    start_datetime = JST.localize(datetime.datetime.combine(start_date, datetime.time.min))
-    end_datetime = JST.localize(datetime.datetime.combine(end_date, datetime.time.max))
+    start_datetime = datetime.datetime.combine(start_date, datetime.time.min, tzinfo=JST)
+    end_datetime = datetime.datetime.combine(end_date, datetime.time.max, tzinfo=JST)
     df['ended_at_dt'] = pd.to_datetime(df['ended_at'], unit='s', utc=True).dt.tz_convert(JST)
     df = df[(df['ended_at_dt'] >= start_datetime) & (df['ended_at_dt'] <= end_datetime)]
 
@@ -181,7 +380,7 @@ def get_backup_events(start_date, end_date):
 
 
 
-@st.cache_data(ttl=600)
+@st.cache_data(ttl=600, show_spinner=False)
 def get_ongoing_events():
     """
     開催中のイベントを取得する
@@ -202,7 +401,7 @@ def get_ongoing_events():
     return ongoing_events
 
 
-@st.cache_data(ttl=3600)
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
 def get_finished_events(start_date, end_date):
     """
     終了したイベントをAPIから取得して返す
@@ -210,8 +409,8 @@ def get_finished_events(start_date, end_date):
     """
     api_events_raw = get_api_events(status=4)
     now_ts = datetime.datetime.now(JST).timestamp()
-    start_ts = JST.localize(datetime.datetime.combine(start_date, datetime.time.min)).timestamp()
-    end_ts = JST.localize(datetime.datetime.combine(end_date, datetime.time.max)).timestamp()
+    start_ts = datetime.datetime.combine(start_date, datetime.time.min, tzinfo=JST).timestamp()
+    end_ts = datetime.datetime.combine(end_date, datetime.time.max, tzinfo=JST).timestamp()
 
     api_events = []
     for event in api_events_raw:
@@ -234,6 +433,17 @@ def get_finished_events(start_date, end_date):
     return api_events
 
 
+@st.cache_resource(show_spinner=False)
+def start_event_prefetch():
+    """
+    開催中イベント一覧のキャッシュをバックグラウンドで温めておく（プロセスにつき1回だけ起動）
+    最初のユーザーは取得済み、または取得中のキャッシュを待つだけで済む
+    """
+    thread = threading.Thread(target=get_ongoing_events, name="event-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
 # ▲▲▲ ここまで修正・追加した関数群 ▲▲▲
 
 
@@ -246,47 +456,111 @@ RANKING_API_CANDIDATES = [
     "https://www.showroom-live.com/api/event/{event_url_key}/ranking?page={page}",
 ]
 
+
+@st.cache_resource(show_spinner=False)
+def get_ranking_url_store():
+    """
+    イベントごとに、前回ランキングを取得できた候補URL（{event_id(str): base_url}。次回はこれだけを先に試す）
+    モジュール変数は再実行のたびに作り直されるため、プロセスで共有するリソースとして保持する
+    """
+    return {}
+
+
 # --- ▼▼▼ 差し替えここから ▼▼▼ ---
 
+def _fetch_ranking_page(url):
+    """ランキング API の1ページ分のリストを取得（404 は None。スレッドプールから呼ばれる）"""
+    response = get_http_session().get(url, timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = _json(response)
+
+    if isinstance(data, dict):
+        for key in ['list', 'ranking', 'event_list', 'data']:
+            if key in data and isinstance(data[key], list):
+                return data[key]
+    elif isinstance(data, list):
+        return data
+    return None
+
+
+def _ranking_entry_room_id(room_info):
+    """ランキング API の1要素から room_id を取り出す（見つからなければ None）"""
+    if not isinstance(room_info, dict):
+        return None
+    room_id = room_info.get('room_id') or room_info.get('id')
+    if not room_id and isinstance(room_info.get('room'), dict):
+        room_id = room_info['room'].get('room_id') or room_info['room'].get('id')
+    return room_id
+
+
+def _probe_ranking_candidates(candidates, event_url_key, event_id):
+    """候補URLの1ページ目を同時に取得し、room_id を含むリストを返した候補を採用する
+
+    戻り値は (base_url, first_page)。どの候補も使えなければ (None, None)。
+    複数の候補が使えた場合は candidates の並び順（前回成功したURLが先頭）を優先する。
+    """
+    submit = make_fetch_submitter()
+    futures = [
+        submit(_fetch_ranking_page, base_url.format(event_url_key=event_url_key, event_id=event_id, page=1))
+        for base_url in candidates
+    ]
+    winner = (None, None)
+    for base_url, future in zip(candidates, futures):
+        if winner[0] is not None:
+            # 既に採用済みなら、残りの候補はまだ始まっていなければ取り消す
+            future.cancel()
+            continue
+        try:
+            first_page = future.result()
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError):
+            continue
+        if first_page and _ranking_entry_room_id(first_page[0]):
+            winner = (base_url, first_page)
+    return winner
+
+
 def _fetch_event_ranking(event_url_key, event_id, max_pages=10):
     """キャッシュを使わずにランキングデータを取得"""
     all_ranking_data = []
-    for base_url in RANKING_API_CANDIDATES:
+    ranking_url_store = get_ranking_url_store()
+    candidates = list(RANKING_API_CANDIDATES)
+    base_url, first_page = None, None
+    preferred_url = ranking_url_store.get(str(event_id))
+    if preferred_url in candidates:
+        # 前回使えた候補URLがあれば、まずそれだけを試す（使えなければ残りの候補にフォールバック）
+        candidates.remove(preferred_url)
+        base_url, first_page = _probe_ranking_candidates([preferred_url], event_url_key, event_id)
+
+    # 候補URLを順番に試すと、先頭の形式が使えない場合に待ち時間が倍になるため、
+    # 1ページ目は残りの全候補を同時に取得し、使える候補だけで残りのページを取得する
+    if base_url is None:
+        base_url, first_page = _probe_ranking_candidates(candidates, event_url_key, event_id)
+    if base_url is not None:
+        all_ranking_data = list(first_page)
+        page_size = len(first_page)
         try:
-            temp_ranking_data = []
-            for page in range(1, max_pages + 1):
-                url = base_url.format(event_url_key=event_url_key, event_id=event_id, page=page)
-                response = requests.get(url, headers=HEADERS, timeout=10)
-                if response.status_code == 404:
-                    break
-                response.raise_for_status()
-                data = response.json()
-
-                ranking_list = None
-                if isinstance(data, dict):
-                    for key in ['list', 'ranking', 'event_list', 'data']:
-                        if key in data and isinstance(data[key], list):
-                            ranking_list = data[key]
-                            break
-                elif isinstance(data, list):
-                    ranking_list = data
-
+            # 2ページ目以降は互いに依存しないため並列に取得し、結果はページ順に検査する
+            page_urls = [
+                base_url.format(event_url_key=event_url_key, event_id=event_id, page=page)
+                for page in range(2, max_pages + 1)
+            ]
+            for ranking_list in fetch_map(_fetch_ranking_page, page_urls):
                 if not ranking_list:
                     break
-                temp_ranking_data.extend(ranking_list)
-            if temp_ranking_data:
-                all_ranking_data = temp_ranking_data
-                break
-        except requests.exceptions.RequestException:
-            continue
+                all_ranking_data.extend(ranking_list)
+                # 1ページ目より件数が少なければ最終ページ（まだ始まっていない残りページの取得は打ち切られる）
+                if len(ranking_list) < page_size:
+                    break
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError):
+            # 途中のページで失敗した場合は、取得できたページまでで集計する
+            pass
+        ranking_url_store[str(event_id)] = base_url
 
     room_map = {}
     for room_info in all_ranking_data:
-        if not isinstance(room_info, dict):
-            continue
-        room_id = room_info.get('room_id') or room_info.get('id')
-        if not room_id and 'room' in room_info:
-            room_id = room_info['room'].get('room_id') or room_info['room'].get('id')
+        room_id = to_int_or_none(_ranking_entry_room_id(room_info))
         if not room_id:
             continue
 
@@ -303,7 +577,7 @@ def _fetch_event_ranking(event_url_key, event_id, max_pages=10):
             rank = None
 
         room_map[str(name)] = {
-            "room_id": str(room_id),
+            "room_id": room_id,
             "rank": rank,
             "point": point
         }
@@ -319,29 +593,43 @@ def _fetch_event_ranking(event_url_key, event_id, max_pages=10):
         )
         room_map = dict(sorted_rooms[:30])
     # ▲▲▲ 追加ここまで ▲▲▲
-    return room_map
+    # ルーム名をインデックスとした DataFrame（room_id は int64 列、rank / point 列）で返す
+    room_map_df = pd.DataFrame(
+        [{"room_name": name, **info} for name, info in room_map.items()],
+        columns=["room_name", "room_id", "rank", "point"]
+    ).astype({"room_id": "int64", "rank": "Int64"})
+    return room_map_df.set_index("room_name")
 
 
-@st.cache_data(ttl=120)
+@st.cache_data(ttl=120, show_spinner=False, max_entries=256)
 def _get_event_ranking_cached(event_url_key, event_id, max_pages=10):
     """キャッシュ付きのランキング取得"""
     return _fetch_event_ranking(event_url_key, event_id, max_pages)
 
 
-def get_event_ranking_with_room_id(event_url_key, event_id, max_pages=10, force_refresh=False):
+@st.cache_data(ttl=FINAL_RANKING_TTL_SECONDS, show_spinner=False, max_entries=256)
+def _get_final_event_ranking_cached(event_url_key, event_id, max_pages=10):
+    """キャッシュ付きのランキング取得（集計が完了して順位・ポイントが確定したイベント用。長めに保持する）"""
+    return _fetch_event_ranking(event_url_key, event_id, max_pages)
+
+
+def get_event_ranking_with_room_id(event_url_key, event_id, max_pages=10, force_refresh=False, is_final=False):
     """
-    SHOWROOMイベントランキングを取得
+    SHOWROOMイベントランキングを取得（ルーム名インデックスの DataFrame）
     - 通常時（force_refresh=False）：キャッシュ利用（負荷軽減）
     - 終了時（force_refresh=True）：キャッシュ無視して最新取得
+    - 集計完了後（is_final=True）：結果が変わらないため、長い TTL のキャッシュを利用
     """
     if force_refresh:
         return _fetch_event_ranking(event_url_key, event_id, max_pages)
+    if is_final:
+        return _get_final_event_ranking_cached(event_url_key, event_id, max_pages)
     return _get_event_ranking_cached(event_url_key, event_id, max_pages)
 
 # --- ▲▲▲ 差し替えここまで ▲▲▲ ---
 
 
-@st.cache_data(ttl=120)
+@st.cache_data(ttl=120, show_spinner=False, max_entries=256)
 def get_event_participant_count(event_url_key, event_id, max_pages=30):
     """
     イベント参加ルーム数を取得する（優先順）
@@ -353,9 +641,9 @@ def get_event_participant_count(event_url_key, event_id, max_pages=30):
     # 1) room_list に問い合わせて total_entries を見る
     try:
         url_room_list = f"https://www.showroom-live.com/api/event/room_list?event_id={event_id}"
-        resp = requests.get(url_room_list, headers=HEADERS, timeout=8)
+        resp = get_http_session().get(url_room_list, timeout=8)
         if resp.status_code == 200:
-            data = resp.json()
+            data = _json(resp)
             if isinstance(data, dict):
                 # server が用意した total_entries があればそれを優先
                 te = data.get("total_entries")
@@ -367,7 +655,7 @@ def get_event_participant_count(event_url_key, event_id, max_pages=30):
                 # なければ list の長さを返す（1ページ分）
                 if isinstance(data.get("list"), list):
                     return len(data.get("list"))
-    except requests.exceptions.RequestException:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError):
         # room_list が使えない場合はフォールバックへ
         pass
 
@@ -382,11 +670,11 @@ def get_event_participant_count(event_url_key, event_id, max_pages=30):
             total_count = 0
             for page in range(1, max_pages + 1):
                 url = base_url.format(page=page)
-                r = requests.get(url, headers=HEADERS, timeout=8)
+                r = get_http_session().get(url, timeout=8)
                 if r.status_code == 404:
                     break
                 r.raise_for_status()
-                d = r.json()
+                d = _json(r)
                 # ranking や event_list など候補を探す
                 if isinstance(d, dict):
                     arr = d.get("ranking") or d.get("event_list") or d.get("list") or d.get("data")
@@ -400,22 +688,66 @@ def get_event_participant_count(event_url_key, event_id, max_pages=30):
                 total_count += len(arr)
             if total_count > 0:
                 return int(total_count)
-    except requests.exceptions.RequestException:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError):
         pass
 
     return None
 
-def get_room_event_info(room_id):
+@st.cache_data(ttl=4, show_spinner=False, max_entries=256)
+def _get_room_event_info_cached(room_id):
+    """
+    ルームのイベント参加情報を取得（失敗時は例外を送出し、失敗結果はキャッシュしない）
+    自動更新の間隔より短い TTL で、フォーム送信などによる直後の再実行では API を叩き直さない
+    """
     url = f"https://www.showroom-live.com/api/room/event_and_support?room_id={room_id}"
+    return get_json_conditional(url, timeout=5)
+
+
+def get_room_event_info(room_id):
+    """
+    ルームのイベント参加情報を取得する（スレッドプールから呼ばれる）
+    戻り値は (data, error)。取得失敗時は data が None、error にエラー内容
+    """
     try:
-        response = requests.get(url, headers=HEADERS, timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"ルームID {room_id} のデータ取得中にエラーが発生しました: {e}")
-        return None
+        return _get_room_event_info_cached(room_id), None
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        return None, e
+
 
-@st.cache_data(ttl=60)
+def fetch_room_payload(room_id, is_block_event):
+    """
+    ルームのイベント情報を取得し、順位とポイントを取り出す（スレッドプールから呼ばれる）
+    戻り値は (payload, fetch_error, skip_reason)
+    - payload: {'rank', 'point'}。取り出せなかった場合は None
+    - fetch_error: 取得時のエラー（無ければ None）
+    - skip_reason: payload が None の理由（'invalid': 不正な形式 / 'incomplete': ランキング情報が不完全）
+    ブロックイベントは後でポイント順位を再計算するため、rank は None で返す
+    """
+    room_info, fetch_error = get_room_event_info(room_id)
+    if not isinstance(room_info, dict):
+        return None, fetch_error, 'invalid'
+
+    rank_info = None
+    if 'ranking' in room_info and isinstance(room_info['ranking'], dict):
+        rank_info = room_info['ranking']
+    elif 'event_and_support_info' in room_info and isinstance(room_info['event_and_support_info'], dict):
+        event_info = room_info['event_and_support_info']
+        if 'ranking' in event_info and isinstance(event_info['ranking'], dict):
+            rank_info = event_info['ranking']
+    elif 'event' in room_info and isinstance(room_info['event'], dict):
+        event_data = room_info['event']
+        if 'ranking' in event_data and isinstance(event_data['ranking'], dict):
+            rank_info = event_data['ranking']
+
+    if not rank_info or 'point' not in rank_info:
+        return None, fetch_error, 'incomplete'
+
+    return {
+        'rank': None if is_block_event else rank_info.get('rank', 'N/A'),
+        'point': rank_info.get('point', 'N/A'),
+    }, fetch_error, None
+
+@st.cache_data(ttl=60, show_spinner=False, max_entries=256)
 def get_block_event_overall_ranking(event_url_key, event_id=None, max_pages=30):
     """
     ブロックイベント全体のランキング（順位情報のみ）を取得する。
@@ -428,11 +760,11 @@ def get_block_event_overall_ranking(event_url_key, event_id=None, max_pages=30):
         # --- まず通常の /ranking?page=n から取得 ---
         for page in range(1, max_pages + 1):
             url = ranking_url_template.format(page=page)
-            response = requests.get(url, headers=HEADERS, timeout=10)
+            response = get_http_session().get(url, timeout=10)
             if response.status_code == 404:
                 break
             response.raise_for_status()
-            data = response.json()
+            data = _json(response)
             ranking_list = data.get("ranking") or data.get("list") or data.get("event_list") or data.get("data") or []
             if not ranking_list:
                 break
@@ -453,9 +785,9 @@ def get_block_event_overall_ranking(event_url_key, event_id=None, max_pages=30):
         if event_id and any(v == 0 for v in rank_map.values()):
             try:
                 roomlist_url = f"https://www.showroom-live.com/api/event/room_list?event_id={event_id}&p={page}"
-                resp = requests.get(roomlist_url, headers=HEADERS, timeout=10)
+                resp = get_http_session().get(roomlist_url, timeout=10)
                 if resp.status_code == 200:
-                    data2 = resp.json()
+                    data2 = _json(resp)
                     room_list = data2.get("list", [])
                     for info in room_list:
                         rid = info.get("room_id")
@@ -475,76 +807,197 @@ def get_block_event_overall_ranking(event_url_key, event_id=None, max_pages=30):
                                 rank_map[rid_str] = int(float(rnk))
                             except Exception:
                                 continue
-            except requests.exceptions.RequestException:
+            except (requests.exceptions.RequestException, orjson.JSONDecodeError):
                 pass
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         st.warning(f"ブロックイベントの全体ランキング取得中にエラーが発生しました: {e}")
 
     return rank_map
 
 
-@st.cache_data(ttl=30)
+def _build_gift_list(data):
+    """
+    ギフトリスト API の JSON から (gift_list_map, ハイライト対象となる 500pt 以上のギフトIDの frozenset) を作る
+    """
+    gift_list_map = {}
+    for gift in data.get('normal', []) + data.get('special', []):
+        try:
+            point_value = int(gift.get('point', 0))
+        except (ValueError, TypeError):
+            point_value = 0
+        gift_list_map[str(gift['gift_id'])] = {
+            'name': gift.get('gift_name', 'N/A'),
+            'point': point_value,
+            'image': gift.get('image', '')
+        }
+    high_value_gift_ids = frozenset(gid for gid, info in gift_list_map.items() if info['point'] >= 500)
+    return gift_list_map, high_value_gift_ids
+
+
+class GiftListCache:
+    """
+    ルームごとのギフトリストを GIFT_LIST_TTL_SECONDS 秒保持し、全セッションで共有する
+    ギフトリストはルーム間でほぼ同じ内容のため、内容のハッシュが同じなら1つの結果オブジェクトを使い回す
+    """
+
+    def __init__(self, ttl=GIFT_LIST_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_room = {}  # room_id -> (取得時刻, (gift_list_map, high_value_gift_ids))
+        self._pool = {}     # レスポンス本文のハッシュ -> (gift_list_map, high_value_gift_ids)
+
+    def get(self, room_id):
+        """(gift_list_map, high_value_gift_ids) を返す（取得失敗時は例外を送出し、失敗結果は保持しない）"""
+        with self._lock:
+            entry = self._by_room.get(room_id)
+        if entry is not None and time.time() - entry[0] <= self.ttl:
+            return entry[1]
+
+        url = f"https://www.showroom-live.com/api/live/gift_list?room_id={room_id}"
+        data, digest = get_json_conditional_with_digest(url, timeout=5)
+        with self._lock:
+            result = self._pool.get(digest)
+            if result is None:
+                result = _build_gift_list(data)
+                if len(self._pool) >= GIFT_LIST_POOL_MAX:
+                    self._pool.clear()
+                self._pool[digest] = result
+            if len(self._by_room) >= GIFT_LIST_POOL_MAX:
+                self._by_room.clear()
+            self._by_room[room_id] = (time.time(), result)
+        return result
+
+
+@st.cache_resource(show_spinner=False)
+def get_gift_list_cache():
+    """プロセスで1つの GiftListCache"""
+    return GiftListCache()
+
+
 def get_gift_list(room_id):
-    url = f"https://www.showroom-live.com/api/live/gift_list?room_id={room_id}"
+    """
+    ギフトリストを取得する（スレッドプールから呼ばれる）
+    戻り値は (gift_list_map, high_value_gift_ids, error)。取得失敗時は空の dict / frozenset とエラー内容
+    返す dict / frozenset は全ルーム・全セッションで共有されるため、呼び出し側で変更しないこと
+    """
     try:
-        response = requests.get(url, headers=HEADERS, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        gift_list_map = {}
-        for gift in data.get('normal', []) + data.get('special', []):
-            try:
-                point_value = int(gift.get('point', 0))
-            except (ValueError, TypeError):
-                point_value = 0
-            gift_list_map[str(gift['gift_id'])] = {
-                'name': gift.get('gift_name', 'N/A'),
-                'point': point_value,
-                'image': gift.get('image', '')
-            }
-        return gift_list_map
-    except requests.exceptions.RequestException as e:
-        st.error(f"ルームID {room_id} のギフトリスト取得中にエラーが発生しました: {e}")
-        return {}
+        gift_list_map, high_value_gift_ids = get_gift_list_cache().get(room_id)
+        return gift_list_map, high_value_gift_ids, None
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        return {}, frozenset(), e
 
 if "gift_log_cache" not in st.session_state:
     st.session_state.gift_log_cache = {}
 
-def get_and_update_gift_log(room_id):
+def fetch_gift_log(room_id):
+    """
+    ギフトログを取得する（スレッドプールから呼ばれる）
+    戻り値は (gift_log, error)。session_state への反映は update_gift_log で行う
+    """
     url = f"https://www.showroom-live.com/api/live/gift_log?room_id={room_id}"
     try:
-        response = requests.get(url, headers=HEADERS, timeout=5)
-        response.raise_for_status()
-        new_gift_log = response.json().get('gift_log', [])
-
-        if room_id not in st.session_state.gift_log_cache:
-            st.session_state.gift_log_cache[room_id] = []
+        return get_json_conditional(url, timeout=5).get('gift_log', []), None
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        return None, e
 
-        existing_log = st.session_state.gift_log_cache[room_id]
+# セッションに保持したギフトログの並べ替えキーと重複判定キー（保持時に両方のキーを必ず持たせるため itemgetter で引ける）
+GIFT_LOG_SORT_KEY = operator.itemgetter('created_at')
+GIFT_LOG_DEDUP_KEY = operator.itemgetter('log_key')
 
-        if new_gift_log:
-            existing_log_set = {(log.get('gift_id'), log.get('created_at'), log.get('num')) for log in existing_log}
-
-            for log in new_gift_log:
-                log_key = (log.get('gift_id'), log.get('created_at'), log.get('num'))
-                if log_key not in existing_log_set:
-                    existing_log.append(log)
-
-        st.session_state.gift_log_cache[room_id].sort(key=lambda x: x.get('created_at', 0), reverse=True)
-
-        return st.session_state.gift_log_cache[room_id]
+def update_gift_log(room_id, fetched):
+    """
+    fetch_gift_log の結果をセッションのギフトログに追記し、新しい順のログを返す（メインスレッドで実行）
+    - ルームごとに {'list': ログ, 'keys': 重複判定キーの set} を保持し、追記分だけ判定する
+    - 保持中のログは新しい順に並べておき、新しいログは追加分だけ並べ替えてマージする
+    - 追加したログには表示用の受信時刻 'created_at_str'（HH:MM:SS、JST）と重複判定キー 'log_key' を付けておく
+    - 保持するのは新しい順に GIFT_LOG_CACHE_MAX 件まで（上限到達後は保持中の最古より古いログを取り込まない）
+    """
+    new_gift_log, error = fetched
+    if error is not None:
+        st.warning(f"ルームID {room_id} のギフトログ取得中にエラーが発生しました。配信中か確認してください: {error}")
+        return st.session_state.gift_log_cache.get(room_id, {}).get('list', [])
+
+    cache = st.session_state.gift_log_cache.setdefault(room_id, {'list': [], 'keys': set()})
+
+    new_logs = []
+    seen_keys = cache['keys']
+    # 保持件数が上限に達していれば、末尾（最古）以前のログは追加しても切り捨てられるだけなので最初から取り込まない
+    # （切り捨てたログのキーは set から外すため、ここで弾かないと API が返し続ける古いログを毎回追加し直してしまう）
+    oldest_kept = cache['list'][-1]['created_at'] if len(cache['list']) >= GIFT_LOG_CACHE_MAX else None
+    for log in new_gift_log or []:
+        created_at = log.get('created_at')
+        if oldest_kept is not None and (created_at or 0) <= oldest_kept:
+            continue
+        log_key = (log.get('gift_id'), created_at, log.get('num'))
+        if log_key not in seen_keys:
+            seen_keys.add(log_key)
+            created_at = created_at or 0
+            # 受信時刻の表示文字列は追加時に1回だけ作り、以降の再描画では使い回す
+            # （取得結果は条件付き GET で共有されるため、元の dict は書き換えずコピーに付ける）
+            new_logs.append({
+                **log,
+                'created_at': created_at,
+                'created_at_str': datetime.datetime.fromtimestamp(created_at, JST).strftime('%H:%M:%S'),
+                'log_key': log_key,
+            })
+
+    if new_logs:
+        # 保持中のログは常に新しい順なので、追加分だけを並べ替えてマージする（全体の再ソートはしない）
+        new_logs.sort(key=GIFT_LOG_SORT_KEY, reverse=True)
+        cache['list'] = list(heapq.merge(cache['list'], new_logs, key=GIFT_LOG_SORT_KEY, reverse=True))
+        # 長時間の配信でもセッションのメモリと重複判定の set が増え続けないよう、古いログから切り捨てる
+        if len(cache['list']) > GIFT_LOG_CACHE_MAX:
+            seen_keys.difference_update(map(GIFT_LOG_DEDUP_KEY, cache['list'][GIFT_LOG_CACHE_MAX:]))
+            del cache['list'][GIFT_LOG_CACHE_MAX:]
+
+    return cache['list']
+
+def render_gift_items(room_id, gift_log, gift_list_map, high_value_gift_ids):
+    """
+    ギフト履歴カードに並べるギフト1件ずつの HTML を連結して返す（メインスレッドで実行）
+    新着ログがあるとセッションのログは別の list に置き換わるため、ログとギフトリストが
+    前回と同じオブジェクトなら、前回組み立てた HTML をそのまま返す
+    """
+    cache = st.session_state.gift_log_cache.get(room_id)
+    if cache is not None:
+        rendered = cache.get('items_html')
+        if rendered is not None and rendered[0] is gift_log and rendered[1] is gift_list_map:
+            return rendered[2]
+
+    parts = []
+    for log in gift_log:
+        gift_id = str(log.get('gift_id'))
+        gift_info = gift_list_map.get(gift_id, {})
+        gift_point = gift_info.get('point', 0)
+        gift_count = log.get('num', 0)
+        total_point = gift_point * gift_count
+        highlight_class = ""
+        if gift_id in high_value_gift_ids:
+            highlight_class = GIFT_HIGHLIGHT_CLASSES[bisect.bisect_right(GIFT_HIGHLIGHT_THRESHOLDS, total_point)]
+
+        gift_image = log.get('image', gift_info.get('image', ''))
+        parts.append(
+            f'<div class="gift-item {highlight_class}">'
+            f'<div class="gift-header"><small>{log["created_at_str"]}</small></div>'
+            f'<div class="gift-info-row"><img src="{gift_image}" class="gift-image" /><span>×{gift_count}</span></div>'
+            f'<div>{gift_point}pt</div></div>'
+        )
+    html = ''.join(parts)
 
-    except requests.exceptions.RequestException as e:
-        st.warning(f"ルームID {room_id} のギフトログ取得中にエラーが発生しました。配信中か確認してください: {e}")
-        return st.session_state.gift_log_cache.get(room_id, [])
+    if cache is not None and cache['list'] is gift_log:
+        cache['items_html'] = (gift_log, gift_list_map, html)
+    return html
 
-def get_onlives_rooms():
+def _fetch_onlives_rooms():
+    """
+    配信中ルームの一覧を取得する（{room_id(int): {'started_at', 'premium_room_type'}}）
+    戻り値は (onlives, err)。失敗時は空の dict とエラーメッセージを返す
+    """
     onlives = {}
     try:
         url = "https://www.showroom-live.com/api/live/onlives"
-        response = requests.get(url, headers=HEADERS, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+        data = get_json_conditional(url, timeout=5)
         all_lives = []
         if isinstance(data, dict):
             if 'onlives' in data and isinstance(data['onlives'], list):
@@ -576,9 +1029,47 @@ def get_onlives_rooms():
                 except (ValueError, TypeError):
                     continue
     except requests.exceptions.RequestException as e:
-        st.warning(f"配信情報取得中にエラーが発生しました: {e}")
+        return onlives, f"配信情報取得中にエラーが発生しました: {e}"
     except (ValueError, AttributeError):
-        st.warning("配信情報のJSONデコードまたは解析に失敗しました。")
+        return onlives, "配信情報のJSONデコードまたは解析に失敗しました。"
+    return onlives, None
+
+
+class OnlivesCache:
+    """
+    配信中ルーム一覧を (取得時刻, 結果) で保持し、全セッションで共有する
+    st.cache_data と違い、再描画のたびに結果をコピー（pickle）し直さない
+    """
+
+    def __init__(self, ttl=ONLIVES_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetched_at = 0.0
+        self._result = ({}, None)
+
+    def get(self):
+        """(onlives, err) を返す。期限切れなら1セッションだけが取り直し、他は完了を待って同じ結果を使う"""
+        with self._lock:
+            if time.time() - self._fetched_at > self.ttl:
+                self._result = _fetch_onlives_rooms()
+                self._fetched_at = time.time()
+            return self._result
+
+
+@st.cache_resource(show_spinner=False)
+def get_onlives_cache():
+    """プロセスで1つの OnlivesCache"""
+    return OnlivesCache()
+
+
+def get_onlives_rooms():
+    """
+    配信中ルームの一覧（全セッション共有、ONLIVES_TTL_SECONDS 秒ごとに更新）
+    戻り値の dict は共有オブジェクトのため、呼び出し側で変更しないこと
+    """
+    onlives, err = get_onlives_cache().get()
+    if err:
+        st.warning(err)
     return onlives
 
 def get_rank_color(rank):
@@ -586,7 +1077,7 @@ def get_rank_color(rank):
     ランキングに応じたカラーコードを返す
     Plotlyのデフォルトカラーを参考に設定
     """
-    colors = px.colors.qualitative.Plotly
+    colors = RANK_COLORS
     if rank is None:
         return "#A9A9A9"  # DarkGray
     try:
@@ -597,6 +1088,76 @@ def get_rank_color(rank):
     except (ValueError, TypeError):
         return "#A9A9A9"
 
+def get_rank_colors(ranks):
+    """
+    順位の列に対応するカラーコードの配列を返す（get_rank_color を NumPy でまとめて計算する版）
+    順位不明（NA・数値化できない値）は DarkGray、0 以下は先頭の色
+    """
+    rank_values = pd.to_numeric(pd.Series(ranks), errors='coerce').astype('Float64').to_numpy(dtype=float, na_value=np.nan)
+    is_missing = np.isnan(rank_values)
+    palette_index = np.where(
+        rank_values <= 0, 0,
+        (np.where(is_missing, 1, rank_values).astype(np.int64) - 1) % len(RANK_COLORS)
+    )
+    return np.where(is_missing, "#A9A9A9", np.asarray(RANK_COLORS)[palette_index])
+
+def get_dashboard_figure(chart_data, y_col, show_gaps, color_map):
+    """
+    ポイント・上位とのポイント差・下位とのポイント差の棒グラフを1枚の Figure（make_subplots）にまとめ、セッション内で使い回す
+    - 初回（またはグラフの段数が変わったとき）のみ Figure を生成し、以降は各トレースの x / y / 色 / ホバー値だけを差し替える
+    - グラフ用データの内容が前回と同じなら何もせずに前回の Figure を返す
+    """
+    panels = [
+        (y_col, "各ルームの現在のポイント", "ポイント", ["現在の順位", "上位とのポイント差", "下位とのポイント差"]),
+    ]
+    if show_gaps:
+        panels += [
+            ("上位とのポイント差", "上位とのポイント差", "ポイント差", ["現在の順位", "現在のポイント"]),
+            ("下位とのポイント差", "下位とのポイント差", "ポイント差", ["現在の順位", "現在のポイント"]),
+        ]
+    chart_key = f"dashboard_chart_{len(panels)}"
+
+    if "chart_cache" not in st.session_state:
+        st.session_state.chart_cache = {}
+    data_hash = hash(tuple(pd.util.hash_pandas_object(chart_data, index=False)))
+    cached = st.session_state.chart_cache.get(chart_key)
+    if cached is not None and cached[0] == data_hash:
+        return cached[1]
+
+    if cached is None:
+        fig = make_subplots(rows=len(panels), cols=1, subplot_titles=[title for _, title, _, _ in panels])
+        for row, (_, _, y_label, hover_cols) in enumerate(panels, start=1):
+            hover_lines = [f"{col}=%{{customdata[{i}]}}" for i, col in enumerate(hover_cols)]
+            fig.add_trace(go.Bar(
+                hovertemplate="<br>".join(["ルーム名=%{x}", f"{y_label}=%{{y}}"] + hover_lines) + "<extra></extra>"
+            ), row=row, col=1)
+            fig.update_xaxes(title_text="ルーム名", row=row, col=1)
+            fig.update_yaxes(title_text=y_label, row=row, col=1)
+        fig.update_layout(height=450 * len(panels), showlegend=False, uirevision="const")
+    else:
+        fig = cached[1]
+
+    room_names = chart_data["ルーム名"].tolist()
+    colors = [color_map.get(name, "#A9A9A9") for name in room_names]
+    for bar, (col, _, _, hover_cols) in zip(fig.data, panels):
+        bar.x = room_names
+        bar.y = chart_data[col].to_numpy(dtype=float, na_value=np.nan)
+        bar.marker.color = colors
+        # Int64 列の欠損（pd.NA）は None にしてから渡す（Plotly は新旧の値を np.array_equal で比較し、pd.NA だと例外になる）
+        hover_data = chart_data[hover_cols].astype(object)
+        bar.customdata = hover_data.where(hover_data.notna(), None).to_numpy()
+    st.session_state.chart_cache[chart_key] = (data_hash, fig)
+    return fig
+
+# ヘルパー：API の値を int に変換（欠損・変換不可は None）
+def to_int_or_none(val):
+    if val is None or val is pd.NA:
+        return None
+    try:
+        return int(float(val))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
 # ヘルパー：表示文字列から数値を抽出（"1,234（※集計中）" -> 1234）
 def extract_int_from_mixed(val):
     if val is None:
@@ -619,6 +1180,54 @@ def extract_int_from_mixed(val):
         except:
             return None
 
+def sort_room_options(room_map, is_block_event):
+    """
+    ルーム選択肢（ルーム名のリスト）を表示順に並べる
+    - ブロック型イベントはポイント順、通常イベントは順位順（順位が無い・0 のルームは末尾）
+    """
+    if room_map is None or room_map.empty:
+        return []
+    if is_block_event:
+        sorted_rooms = room_map.sort_values('point', ascending=False, kind='stable')
+    else:
+        sorted_rooms = room_map.sort_values(
+            'rank', kind='stable', na_position='last',
+            key=lambda r: r.mask(r.fillna(0) == 0)
+        )
+    return sorted_rooms.index.tolist()
+
+def compute_point_gaps(points):
+    """
+    ポイント降順に並べたときの「上位とのポイント差」「下位とのポイント差」を算出する
+    - 戻り値は入力と同じ並び順の int64 配列 (upper, lower)
+    - ポイント不明（NaN）のルームとの差は 0 とする
+    """
+    pts = np.asarray(points, dtype=float)
+    order = np.argsort(-pts, kind="stable")  # NaN は末尾に並ぶ
+    sorted_pts = pts[order]
+    # 隣接差は1回だけ計算し、先頭（上位なし）・末尾（下位なし）に 0 を補う
+    diffs = np.nan_to_num(np.abs(np.diff(sorted_pts))).astype(np.int64)
+    upper = np.empty(len(pts), dtype=np.int64)
+    lower = np.empty(len(pts), dtype=np.int64)
+    upper[order] = np.concatenate(([0], diffs))
+    lower[order] = np.concatenate((diffs, [0]))
+    return upper, lower
+
+
+def highlight_rows(data):
+    """ステータス表の行の背景色（配信中は緑、奇数行は薄いグレー）を表全体まとめて生成する"""
+    is_live = (data['配信中'] == '🔴').to_numpy()
+    is_odd = np.arange(len(data)) % 2 == 1
+    row_styles = np.select(
+        [is_live, is_odd],
+        ['background-color: #e6fff2', 'background-color: #fcfcfc'],
+        default=''
+    )
+    return pd.DataFrame(
+        np.repeat(row_styles[:, None], data.shape[1], axis=1),
+        index=data.index, columns=data.columns
+    )
+
 def main():
     st.markdown(
         "<h1 style='font-size:28px; text-align:left; color:#1f2937;'>🎤 SHOWROOM Event Dashboard</h1>",
@@ -642,7 +1251,7 @@ def main():
         if st.button("認証する"):
             if input_room_id:  # 入力が空でない場合のみ
                 try:
-                    response = requests.get(ROOM_LIST_URL, timeout=5)
+                    response = get_http_session().get(ROOM_LIST_URL, timeout=5)
                     response.raise_for_status()
                     room_df = pd.read_csv(io.StringIO(response.text), header=None)
 
@@ -820,6 +1429,9 @@ def main():
     if st.session_state.selected_event_name != selected_event_name or st.session_state.room_map_data is None:
         with st.spinner('イベント参加者情報を取得中...'):
             st.session_state.room_map_data = get_event_ranking_with_room_id(selected_event_key, selected_event_id)
+        st.session_state.sorted_room_options = sort_room_options(
+            st.session_state.room_map_data, selected_event_data.get("is_event_block", False)
+        )
         st.session_state.selected_event_name = selected_event_name
         st.session_state.selected_room_names = []
         st.session_state.multiselect_default_value = []
@@ -828,10 +1440,14 @@ def main():
         if 'select_top_10_checkbox' in st.session_state:
             st.session_state.select_top_10_checkbox = False
         st.session_state.show_dashboard = False
-        st.rerun()
+        # 前のイベントのルームに紐づくセッションデータは破棄する（タブを閉じても解放されないため溜め込まない）
+        st.session_state.gift_log_cache = {}
+        st.session_state.pop('chart_cache', None)
+        # st.rerun() はしない（リセットした状態のまま、この実行で以降のウィジェットを描画する）
 
     room_count_text = ""
-    if st.session_state.room_map_data:
+    has_room_map = st.session_state.room_map_data is not None and not st.session_state.room_map_data.empty
+    if has_room_map:
         # total_entries を優先取得（room_list -> ranking のフォールバック）
         try:
             participant_count = get_event_participant_count(selected_event_key, selected_event_id, max_pages=30)
@@ -849,7 +1465,7 @@ def main():
                 room_count_text = ""
     st.markdown(f"**▶ [イベントページへ移動する]({event_url})**{room_count_text}", unsafe_allow_html=True)
 
-    if not st.session_state.room_map_data:
+    if not has_room_map:
         st.warning("このイベントの参加者情報を取得できませんでした。")
         return
 
@@ -857,16 +1473,13 @@ def main():
         select_top_10 = st.checkbox(
             "上位10ルームまでを選択（**※チェックされている場合はこちらが優先されます**）", 
             key="select_top_10_checkbox")
-        room_map = st.session_state.room_map_data
-        is_block_event = selected_event_data.get("is_event_block", False)
-
-        # ✅ ブロック型イベントはポイント順、通常イベントは順位順
-        if is_block_event:
-            sorted_rooms = sorted(room_map.items(), key=lambda item: item[1].get('point', 0), reverse=True)
-        else:
-            sorted_rooms = sorted(room_map.items(), key=lambda item: (item[1].get('rank') or float('inf')))
-
-        room_options = [room[0] for room in sorted_rooms]
+        # 並び替え済みの選択肢はイベント選択時に作成済み（毎回の再描画では並べ替えない）
+        room_options = st.session_state.get('sorted_room_options')
+        if room_options is None:
+            room_options = sort_room_options(
+                st.session_state.room_map_data, selected_event_data.get("is_event_block", False)
+            )
+            st.session_state.sorted_room_options = room_options
 
         # ✅ ブロック型イベントはポイント上位10、通常は順位上位10
         top_10_rooms = room_options[:10]
@@ -880,15 +1493,17 @@ def main():
 
     if submit_button:
         #st.session_state.auto_refresh_enabled = True
+        st.session_state.show_dashboard = True
         if st.session_state.select_top_10_checkbox:
             st.session_state.selected_room_names = top_10_rooms
             st.session_state.multiselect_default_value = top_10_rooms
             st.session_state.multiselect_key_counter += 1
+            # 上位10ルームはマルチセレクトを作り直して選択状態を反映させる必要があるため、この場合のみ再実行する
+            st.rerun()
         else:
+            # 通常の選択はマルチセレクトが既に選択状態を表示しているため、再実行せずにこのままダッシュボードを描画する
             st.session_state.selected_room_names = selected_room_names_temp
             st.session_state.multiselect_default_value = selected_room_names_temp
-        st.session_state.show_dashboard = True
-        st.rerun()
 
     if st.session_state.show_dashboard:
             if not st.session_state.selected_room_names:
@@ -1043,7 +1658,15 @@ def main():
                             </script>
                             """, height=80)
 
+    # ▼ ここから下のリアルタイム表示は fragment として定期的に単独で再実行する
+    #   （イベント・ルーム選択などの上部は再実行せず、ここで使う値は直前の全体実行時のものを参照する）
+    #   終了済みイベントは順位・ポイントが確定しているため、更新間隔を広げて API への問い合わせを減らす
+    dashboard_refresh_seconds = (
+        DASHBOARD_REFRESH_SECONDS_ENDED if datetime.datetime.now(JST) > ended_at_dt else DASHBOARD_REFRESH_SECONDS
+    )
 
+    @st.fragment(run_every=dashboard_refresh_seconds)
+    def live_dashboard():
             current_time = datetime.datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
             st.write(f"最終更新日時 (日本時間): {current_time}")
 
@@ -1057,19 +1680,21 @@ def main():
                     event_url_key = selected_event_data.get('event_url_key')
                     event_id = selected_event_data.get('event_id')
                     #final_ranking_map = get_event_ranking_with_room_id(event_url_key, event_id, max_pages=30, force_refresh=True)
-                    final_ranking_map = get_event_ranking_with_room_id(event_url_key, event_id, max_pages=30, force_refresh=False)
-                    if final_ranking_map:
-                        for name, data in final_ranking_map.items():
-                            if 'room_id' in data:
-                                final_ranking_data[data['room_id']] = {
-                                    'rank': data.get('rank'), 'point': data.get('point')
-                                }
+                    final_ranking_map = get_event_ranking_with_room_id(
+                        event_url_key, event_id, max_pages=30, force_refresh=False, is_final=not is_aggregating
+                    )
+                    if not final_ranking_map.empty:
+                        final_ranking_data = (
+                            final_ranking_map.drop_duplicates('room_id', keep='last')
+                            .set_index('room_id')[['rank', 'point']].to_dict('index')
+                        )
                     else:
                         st.warning("イベント終了後の最終ランキングデータを取得できませんでした。")
 
             onlives_rooms = get_onlives_rooms()
 
-            data_to_display = []
+            # 表示データは列ごとのリストで保持し、最後に一度だけ DataFrame 化する
+            live_flags, room_names, ranks, points, started_at_strs = [], [], [], [], []
 
             is_block_event = selected_event_data.get("is_event_block", False)
             block_event_ranks = {}
@@ -1080,215 +1705,159 @@ def main():
                         event_id=selected_event_data.get('event_id')
                     )
 
+            # ギフトログ・ギフトリストの取得はルーム情報の取得と同じタイミングで投入し、1回の待ち時間にまとめる
+            gift_log_futures, gift_list_futures = {}, {}
+            # 選択ルームのうち配信中・プレミアムライブ中のルームID（int）。表示とスペシャルギフト履歴で共用する
+            live_room_ids, premium_room_ids = set(), set()
+            # 選択ルームの「ルーム名 → room_id（int）」。各セクションで room_map_data を引き直さずに使う
+            room_id_by_name = {}
+
             if st.session_state.selected_room_names:
+                room_map = st.session_state.room_map_data
+                known_room_names = []
+                for room_name in st.session_state.selected_room_names:
+                    if room_name in room_map.index:
+                        known_room_names.append(room_name)
+                    else:
+                        st.error(f"選択されたルーム名 '{room_name}' が見つかりません。リストを更新してください。")
+                # 選択ルームの room_id / rank はまとめて取り出す
+                selected_room_map = room_map.loc[known_room_names]
+                selected_room_ids = selected_room_map['room_id'].tolist()
+                selected_room_ranks = selected_room_map['rank'].to_numpy()
+                room_id_by_name = dict(zip(known_room_names, selected_room_ids))
+
+                live_room_ids = onlives_rooms.keys() & set(selected_room_ids)
+                premium_room_ids = {
+                    room_id for room_id in live_room_ids
+                    if onlives_rooms[room_id].get('premium_room_type') == 1
+                }
                 premium_live_rooms = [
-                    name for name in st.session_state.selected_room_names
-                    if st.session_state.room_map_data and name in st.session_state.room_map_data and
-                    int(st.session_state.room_map_data[name]['room_id']) in onlives_rooms and
-                    onlives_rooms.get(int(st.session_state.room_map_data[name]['room_id']), {}).get('premium_room_type') == 1
+                    name for name, room_id in zip(known_room_names, selected_room_ids)
+                    if room_id in premium_room_ids
                 ]
 
+                # この更新で投げるギフト・ルーム情報の取得は、まとめて FETCH_MAX_CONCURRENCY 件までを同時に実行する
+                submit = make_fetch_submitter()
+                for room_id in live_room_ids - premium_room_ids:
+                    gift_log_futures[room_id] = submit(fetch_gift_log, room_id)
+                    gift_list_futures[room_id] = submit(get_gift_list, room_id)
+
                 if premium_live_rooms:
                     room_names_str = '、'.join([f"'{name}'" for name in premium_live_rooms])
                     st.info(f"{room_names_str} は、プレミアムライブのため、ポイントおよびスペシャルギフト履歴情報は取得できません。")
 
-                for room_name in st.session_state.selected_room_names:
-                    try:
-                        if room_name not in st.session_state.room_map_data:
-                            st.error(f"選択されたルーム名 '{room_name}' が見つかりません。リストを更新してください。")
-                            continue
+                # 開催中イベントは各ルームの順位・ポイントをスレッドプールで並列に取得・抽出しておく（プレミアムライブは対象外）
+                # ワーカーでは st.* を呼ばず、エラーは戻り値で受け取ってここ（メインスレッド）で表示する
+                room_payloads = {}
+                if not is_event_ended:
+                    fetch_room_ids = [room_id for room_id in selected_room_ids if room_id not in premium_room_ids]
+                    room_payload_futures = [submit(fetch_room_payload, room_id, is_block_event) for room_id in fetch_room_ids]
+                    room_payloads = dict(zip(fetch_room_ids, (future.result() for future in room_payload_futures)))
 
-                        room_id = st.session_state.room_map_data[room_name]['room_id']
-                        rank, point, upper_gap, lower_gap = 'N/A', 'N/A', 'N/A', 'N/A'
+                for room_name, room_id, map_rank in zip(known_room_names, selected_room_ids, selected_room_ranks):
+                    try:
+                        rank, point = 'N/A', 'N/A'
 
-                        is_live = int(room_id) in onlives_rooms
-                        is_premium_live = False
-                        if is_live:
-                            live_info = onlives_rooms.get(int(room_id))
-                            if live_info and live_info.get('premium_room_type') == 1:
-                                is_premium_live = True
+                        is_live = room_id in live_room_ids
+                        is_premium_live = room_id in premium_room_ids
 
                         if is_premium_live:
-                            rank = st.session_state.room_map_data[room_name].get('rank')
+                            rank = map_rank
 
                             started_at_str = ""
                             if is_live:
-                                started_at_ts = onlives_rooms.get(int(room_id), {}).get('started_at')
+                                started_at_ts = onlives_rooms[room_id].get('started_at')
                                 if started_at_ts:
                                     started_at_dt = datetime.datetime.fromtimestamp(started_at_ts, JST)
                                     started_at_str = started_at_dt.strftime("%Y/%m/%d %H:%M")
 
-                            data_to_display.append({
-                                "配信中": "🔴",
-                                "ルーム名": room_name,
-                                "現在の順位": rank,
-                                "現在のポイント": "N/A",
-                                "上位とのポイント差": "N/A",
-                                "下位とのポイント差": "N/A",
-                                "配信開始時間": started_at_str
-                            })
+                            live_flags.append(True)
+                            room_names.append(room_name)
+                            ranks.append(to_int_or_none(rank))
+                            points.append(None)
+                            started_at_strs.append(started_at_str)
                             continue
 
                         if is_event_ended:
                             if room_id in final_ranking_data:
                                 rank = final_ranking_data[room_id].get('rank', 'N/A')
                                 point = final_ranking_data[room_id].get('point', 'N/A')
-                                upper_gap, lower_gap = 0, 0
                             else:
                                 st.warning(f"ルーム名 '{room_name}' の最終ランキング情報が見つかりませんでした。")
                                 continue
                         else:
-                            room_info = get_room_event_info(room_id)
-                            if not isinstance(room_info, dict):
+                            payload, fetch_error, skip_reason = room_payloads[room_id]
+                            if fetch_error is not None:
+                                st.error(f"ルームID {room_id} のデータ取得中にエラーが発生しました: {fetch_error}")
+                            if skip_reason == 'invalid':
                                 st.warning(f"ルームID {room_id} のデータが不正な形式です。スキップします。")
                                 continue
-
-                            rank_info = None
-                            if 'ranking' in room_info and isinstance(room_info['ranking'], dict):
-                                rank_info = room_info['ranking']
-                            elif 'event_and_support_info' in room_info and isinstance(room_info['event_and_support_info'], dict):
-                                event_info = room_info['event_and_support_info']
-                                if 'ranking' in event_info and isinstance(event_info['ranking'], dict):
-                                    rank_info = event_info['ranking']
-                            elif 'event' in room_info and isinstance(room_info['event'], dict):
-                                event_data = room_info['event']
-                                if 'ranking' in event_data and isinstance(event_data['ranking'], dict):
-                                    rank_info = event_data['ranking']
-
-                            if rank_info and 'point' in rank_info:
-                                point = rank_info.get('point', 'N/A')
-                                upper_gap = rank_info.get('upper_gap', 'N/A')
-                                lower_gap = rank_info.get('lower_gap', 'N/A')
-
-                                if is_block_event:
-                                    # ブロックイベントは後でポイント順位を再計算するため、ここでは一旦 None
-                                    rank = None
-                                else:
-                                    rank = rank_info.get('rank', 'N/A')
-
-                            else:
+                            if skip_reason == 'incomplete':
                                 st.warning(f"ルーム名 '{room_name}' のランキング情報が不完全です。スキップします。")
                                 continue
+                            rank, point = payload['rank'], payload['point']
 
                         started_at_str = ""
                         if is_live:
-                            started_at_ts = onlives_rooms.get(int(room_id), {}).get('started_at')
+                            started_at_ts = onlives_rooms[room_id].get('started_at')
                             if started_at_ts:
                                 started_at_dt = datetime.datetime.fromtimestamp(started_at_ts, JST)
                                 started_at_str = started_at_dt.strftime("%Y/%m/%d %H:%M")
 
-                        data_to_display.append({
-                            "配信中": "🔴" if is_live else "", "ルーム名": room_name,
-                            "現在の順位": rank, "現在のポイント": point,
-                            "上位とのポイント差": upper_gap, "下位とのポイント差": lower_gap,
-                            "配信開始時間": started_at_str
-                        })
+                        live_flags.append(is_live)
+                        room_names.append(room_name)
+                        ranks.append(to_int_or_none(rank))
+                        points.append(to_int_or_none(point))
+                        started_at_strs.append(started_at_str)
                     except Exception as e:
                         st.error(f"データ処理中に予期せぬエラーが発生しました（ルーム名: {room_name}）。エラー: {e}")
                         continue
 
-            # ✅ ブロックイベントの場合、ポイントで順位を再付与（ブロック分け無視の総合順位）
-            if is_block_event and data_to_display:
-                sorted_by_point = sorted(
-                    data_to_display,
-                    key=lambda x: extract_int_from_mixed(x.get('現在のポイント', 0)),
-                    reverse=True
-                )
-                for idx, item in enumerate(sorted_by_point, start=1):
-                    item['現在の順位'] = idx
-                data_to_display = sorted_by_point  # 順序をポイント順に統一
-
-            if data_to_display:
-                df = pd.DataFrame(data_to_display)
+            if room_names:
+                # --- 数値列の準備（ポイント・順位は収集時に int 化済み。欠損は NA の Int64 配列） ---
+                ranks_arr = pd.array(ranks, dtype="Int64")
+                points_arr = pd.array(points, dtype="Int64")
 
+                if is_block_event:
+                    # ✅ ブロックイベントの場合、ポイント順に並べて順位を再付与（ブロック分け無視の総合順位）
+                    order = np.argsort(-points_arr.to_numpy(dtype=float, na_value=-np.inf), kind='stable')
+                    ranks_arr = pd.array(np.arange(1, len(order) + 1), dtype="Int64")
+                else:
+                    # 順位ソート（終了イベントは有効な順位を優先、NA は末尾）
+                    rank_key = ranks_arr.to_numpy(dtype=float, na_value=np.inf)
+                    if is_event_ended and not is_aggregating:
+                        has_valid_rank = (ranks_arr > 0).to_numpy(dtype=bool, na_value=False)
+                        order = np.lexsort((rank_key, ~has_valid_rank))
+                    else:
+                        order = np.argsort(rank_key, kind='stable')
+                    ranks_arr = ranks_arr[order]
 
-                # --- 新：数値列の準備（ポイントの数値列を保持して計算に使用） ---
-                # 元のポイント列は混在するため数値抽出を行う
-                df['現在のポイント_numeric'] = pd.to_numeric(df['現在のポイント'], errors='coerce')
-                # NaN を 0 にしないでそのままにする（差分計算時は fillna で扱う）
-                # 現在の順位は数値化
-                df['現在の順位'] = pd.to_numeric(df['現在の順位'], errors='coerce')
+                points_arr = points_arr[order]
+                # ポイント差を算出（ポイント降順で隣接ルームとの差）
+                upper_gaps, lower_gaps = compute_point_gaps(points_arr.to_numpy(dtype=float, na_value=np.nan))
 
-                # ブロックイベントか否かでソート方針は従来どおり
                 if is_aggregating:
                     # イベント終了後の集計中表示だが、ポイント自体は表示する（xxxxxxx（※集計中））
-                    # 順位ソート（ブロックイベントは has_valid_rank 優先）
-                    if is_block_event:
-                        df['has_valid_rank'] = df['現在の順位'] > 0
-                        df = df.sort_values(by=['has_valid_rank', '現在の順位'], ascending=[False, True], na_position='last').reset_index(drop=True)
-                        df = df.drop(columns=['has_valid_rank'])
-                    else:
-                        df = df.sort_values(by='現在の順位', ascending=True, na_position='last').reset_index(drop=True)
-
-                    # ポイント差を算出（数値列を用いる）
-                    df_sorted_by_points = df.sort_values(by='現在のポイント_numeric', ascending=False, na_position='last').reset_index(drop=True)
-                    df_sorted_by_points['上位とのポイント差'] = (df_sorted_by_points['現在のポイント_numeric'].shift(1) - df_sorted_by_points['現在のポイント_numeric']).abs().fillna(0).astype(int)
-                    df_sorted_by_points['下位とのポイント差'] = (df_sorted_by_points['現在のポイント_numeric'].shift(-1) - df_sorted_by_points['現在のポイント_numeric']).abs().fillna(0).astype(int)
-
-                    # merge して差分列を戻す
-                    df = pd.merge(df.drop(columns=['上位とのポイント差', '下位とのポイント差'], errors='ignore'), df_sorted_by_points[['ルーム名', '上位とのポイント差', '下位とのポイント差']], on='ルーム名', how='left')
-
-                    # 表示用ポイント列を作成（カンマ区切り + 集計中注記）
-                    def fmt_agg(x):
-                        try:
-                            if pd.isna(x):
-                                return "（※集計中）"
-                            return f"{int(x):,}（※集計中）"
-                        except:
-                            return "（※集計中）"
-                    df['現在のポイント_display'] = df['現在のポイント_numeric'].apply(fmt_agg)
-                    # UI 表示列に置き換え（計算用の numeric 列は残す）
-                    df['現在のポイント'] = df['現在のポイント_display']
-                    df = df.drop(columns=['現在のポイント_display'])
-
-                    # 差分は数値列のままにしておく（後でスタイルで桁区切り）
-                    df['上位とのポイント差'] = df['上位とのポイント差'].fillna(0).astype(int)
-                    df['下位とのポイント差'] = df['下位とのポイント差'].fillna(0).astype(int)
-
-                    # 配信開始時間のカラム位置調整（従来どおり）
-                    started_at_column = df['配信開始時間']
-                    df = df.drop(columns=['配信開始時間'])
-                    df.insert(1, '配信開始時間', started_at_column)
-
+                    points_column = [
+                        "（※集計中）" if x is pd.NA else f"{x:,}（※集計中）"
+                        for x in points_arr
+                    ]
                 else:
-                    # 集計前（通常表示）: 数値化してソート・差分算出（従来のロジック）
-                    df['現在のポイント'] = pd.to_numeric(df['現在のポイント'], errors='coerce')
-
-                    if is_event_ended or is_block_event: # ブロックイベントも順位でソート
-                        df['has_valid_rank'] = df['現在の順位'] > 0
-                        df = df.sort_values(by=['has_valid_rank', '現在の順位'], ascending=[False, True], na_position='last').reset_index(drop=True)
-                        df = df.drop(columns=['has_valid_rank'])
-                    else:
-                        df = df.sort_values(by='現在の順位', ascending=True, na_position='last').reset_index(drop=True)
-
-                    live_status = df['配信中']
-                    df = df.drop(columns=['配信中'])
-
-                    df_sorted_by_points = df.sort_values(by='現在のポイント', ascending=False, na_position='last').reset_index(drop=True)
-                    df_sorted_by_points['上位とのポイント差'] = (df_sorted_by_points['現在のポイント'].shift(1) - df_sorted_by_points['現在のポイント']).abs().fillna(0).astype(int)
-                    df_sorted_by_points['下位とのポイント差'] = (df_sorted_by_points['現在のポイント'].shift(-1) - df_sorted_by_points['現在のポイント']).abs().fillna(0).astype(int)
-
-                    df = pd.merge(df.drop(columns=['上位とのポイント差', '下位とのポイント差'], errors='ignore'), df_sorted_by_points[['ルーム名', '上位とのポイント差', '下位とのポイント差']], on='ルーム名', how='left')
-
-                    df.insert(0, '配信中', live_status)
-
-                    started_at_column = df['配信開始時間']
-                    df = df.drop(columns=['配信開始時間'])
-                    df.insert(1, '配信開始時間', started_at_column)
+                    points_column = points_arr
+
+                df = pd.DataFrame({
+                    '配信中': np.where(np.array(live_flags, dtype=bool)[order], '🔴', ''),
+                    '配信開始時間': np.array(started_at_strs, dtype=object)[order],
+                    'ルーム名': np.array(room_names, dtype=object)[order],
+                    '現在の順位': ranks_arr,
+                    '現在のポイント': points_column,
+                    '現在のポイント_numeric': points_arr,
+                    '上位とのポイント差': upper_gaps,
+                    '下位とのポイント差': lower_gaps,
+                })
 
                 # ---- 表示（スタイル適用） ----
-                st.markdown(
-                    """
-                    <style>
-                    h3.custom-status-title {
-                        padding-top: 0 !important;
-                        padding-bottom: 0px !important;
-                        margin: 0 !important;
-                    }
-                    </style>
-                    """,
-                    unsafe_allow_html=True
-                )
+                st.markdown(STATUS_TABLE_CSS, unsafe_allow_html=True)
                 st.markdown(
                     "<h3 class='custom-status-title'>📊 比較対象ルームのステータス</h3>",
                     unsafe_allow_html=True
@@ -1297,72 +1866,21 @@ def main():
                 required_cols = ['現在のポイント', '上位とのポイント差', '下位とのポイント差']
                 if all(col in df.columns for col in required_cols):
                     try:
-                        # 表示用: numeric列は削除
-                        display_df = df.drop(columns=['現在のポイント_numeric'], errors='ignore')
-
-                        # 行の背景色ハイライト関数
-                        def highlight_rows(row):
-                            if row['配信中'] == '🔴':
-                                return ['background-color: #e6fff2'] * len(row)
-                            elif row.name % 2 == 1:
-                                return ['background-color: #fcfcfc'] * len(row)
-                            else:
-                                return [''] * len(row)
-
-                        df_to_format = df.copy()
-
-                        # 集計中ポイントも右寄せを強制
-                        st.markdown(
-                            """
-                            <style>
-                            div[data-testid="stDataFrame"] td {
-                                text-align: right !important;
-                            }
-                            div[data-testid="stDataFrame"] th {
-                                text-align: center !important;
-                            }
-                            </style>
-                            """,
-                            unsafe_allow_html=True
+                        # 表示用: ポイントは数値列（numeric）を表示列として使い、コピーや列の作り直しはしない
+                        display_df = (
+                            df.drop(columns=['現在のポイント'])
+                            .rename(columns={'現在のポイント_numeric': '現在のポイント'})
                         )
 
-                        if not is_aggregating:
-                            # ✅ 通常時: ヘッダーはそのまま、セルは数値＋カンマ区切り
-                            for col in ['現在のポイント', '上位とのポイント差', '下位とのポイント差']:
-                                df_to_format[col] = pd.to_numeric(df_to_format[col], errors='coerce').fillna(0).astype(int)
-
-                            styled_df = (
-                                df_to_format.drop(columns=['現在のポイント_numeric'], errors='ignore')
-                                .style.apply(highlight_rows, axis=1)
-                                .format({
-                                    '現在のポイント': '{:,}',
-                                    '上位とのポイント差': '{:,}',
-                                    '下位とのポイント差': '{:,}'
-                                })
-                                .set_properties(subset=['現在のポイント','上位とのポイント差','下位とのポイント差'],
-                                                **{'text-align': 'right'})
-                            )
-
-                        else:
+                        if is_aggregating:
                             st.markdown("<span style='color:red; font-weight:bold;'>※ポイントは集計中です</span>", unsafe_allow_html=True)
-                            # ✅ 集計中: ヘッダーを「現在のポイント（※集計中）」に変更し、セルには数値のみを表示
-                            df_to_format = df.copy()
-                            df_to_format.rename(columns={'現在のポイント': '現在のポイント'}, inplace=True)
-
-                            # 数値部分を抽出（既存の numeric 列を使用）
-                            df_to_format['現在のポイント'] = df['現在のポイント_numeric'].apply(lambda x: int(x) if pd.notnull(x) else 0)
-
-                            styled_df = (
-                                df_to_format.drop(columns=['現在のポイント_numeric'], errors='ignore')
-                                .style.apply(highlight_rows, axis=1)
-                                .format({
-                                    '現在のポイント': '{:,}',
-                                    '上位とのポイント差': '{:,}',
-                                    '下位とのポイント差': '{:,}'
-                                })
-                                .set_properties(subset=['現在のポイント','上位とのポイント差','下位とのポイント差'],
-                                                **{'text-align': 'right'})
-                            )
+
+                        # ✅ セルは数値＋カンマ区切り（集計中もセルには数値のみを表示、ポイント不明は 0）
+                        styled_df = (
+                            display_df.style.apply(highlight_rows, axis=None)
+                            .format('{:,}', subset=required_cols, na_rep='0')
+                            .set_properties(subset=required_cols, **{'text-align': 'right'})
+                        )
 
                         #st.markdown("<span style='color:red; font-weight:bold;'>※集計中のポイントです</span>", unsafe_allow_html=True)
                         st.dataframe(styled_df, use_container_width=True, hide_index=True, height=265)
@@ -1382,59 +1900,18 @@ def main():
             st.markdown(f"### {gift_history_title}", unsafe_allow_html=True)
 
             gift_container = st.container()        
-            css_style = """
-                <style>
-                .container-wrapper { display: flex; flex-wrap: wrap; gap: 15px; }
-                .room-container {
-                    position: relative; width: 163px; flex-shrink: 0; border: 1px solid #ddd; border-radius: 5px;
-                    padding: 10px; height: 500px; display: flex; flex-direction: column; padding-top: 30px; margin-top: 16px;
-                    margin-bottom: 16px;
-                }
-                .ranking-label {
-                    position: absolute; top: -12px; left: 50%; transform: translateX(-50%); padding: 2px 8px;
-                    border-radius: 12px; color: white; font-weight: bold; font-size: 0.9rem; z-index: 10;
-                    white-space: nowrap; box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                }
-                .room-title {
-                    text-align: center; font-size: 1rem; font-weight: bold; margin-bottom: 10px; display: -webkit-box;
-                    -webkit-line-clamp: 3; -webkit-box-orient: vertical; overflow: hidden; white-space: normal;
-                    line-height: 1.4em; min-height: calc(1.4em * 3);
-                }
-                .gift-list-container { flex-grow: 1; height: 400px; overflow-y: scroll; scrollbar-width: auto; }
-                .gift-item { display: flex; flex-direction: column; padding: 8px 8px; border-bottom: 1px solid #eee; gap: 4px; }
-                .gift-item:last-child { border-bottom: none; }
-                .gift-header { font-weight: bold; }
-                .gift-info-row { display: flex; align-items: center; gap: 8px; flex-wrap: wrap; }
-                .gift-image { width: 30px; height: 30px; border-radius: 5px; object-fit: contain; }
-                .highlight-10000 { background-color: #ffe5e5; } .highlight-30000 { background-color: #ffcccc; }
-                .highlight-60000 { background-color: #ffb2b2; } .highlight-100000 { background-color: #ff9999; }
-                .highlight-300000 { background-color: #ff7f7f; }
-                </style>
-            """
-
             live_rooms_data = []
-            if 'df' in locals() and not df.empty and st.session_state.room_map_data:
-                selected_live_room_ids = {
-                    int(st.session_state.room_map_data[row['ルーム名']]['room_id']) for index, row in df.iterrows() 
-                    if '配信中' in row and row['配信中'] == '🔴' and onlives_rooms.get(int(st.session_state.room_map_data[row['ルーム名']]['room_id']), {}).get('premium_room_type') != 1
-                }
-                rooms_to_delete = [room_id for room_id in st.session_state.gift_log_cache if int(room_id) not in selected_live_room_ids]
-                for room_id in rooms_to_delete:
+            if 'df' in locals() and not df.empty and has_room_map:
+                # 配信が終わった・選択から外れたルームのギフトログは破棄する
+                for room_id in st.session_state.gift_log_cache.keys() - (live_room_ids - premium_room_ids):
                     del st.session_state.gift_log_cache[room_id]
 
-                for index, row in df.iterrows():
-                    room_name = row['ルーム名']
-                    if room_name in st.session_state.room_map_data:
-                        room_id = st.session_state.room_map_data[room_name]['room_id']
-                        if int(room_id) in onlives_rooms:
-                            if onlives_rooms.get(int(room_id), {}).get('premium_room_type') != 1:
-                                live_rooms_data.append({
-                                    "room_name": room_name, "room_id": room_id, "rank": row['現在の順位']
-                                })
-                            else:
-                                live_rooms_data.append({
-                                    "room_name": room_name, "room_id": room_id, "rank": row['現在の順位']
-                                })
+                for room_name, rank in zip(df['ルーム名'], df['現在の順位']):
+                    room_id = room_id_by_name.get(room_name)
+                    if room_id in live_room_ids:
+                        live_rooms_data.append({
+                            "room_name": room_name, "room_id": room_id, "rank": rank
+                        })
 
             room_html_list = []
             if len(live_rooms_data) > 0:
@@ -1444,7 +1921,7 @@ def main():
                     rank = room_data.get('rank', 'N/A')
                     rank_color = get_rank_color(rank)
 
-                    if onlives_rooms.get(int(room_id), {}).get('premium_room_type') == 1:
+                    if room_id in premium_room_ids:
                         html_content = f"""
                         <div class="room-container">
                             <div class="ranking-label" style="background-color: {rank_color};">{rank}位</div>
@@ -1457,49 +1934,34 @@ def main():
                         room_html_list.append(html_content)
                         continue
 
-                    if int(room_id) in onlives_rooms:
-                        gift_log = get_and_update_gift_log(room_id)
-                        gift_list_map = get_gift_list(room_id)
+                    if room_id in live_room_ids:
+                        gift_log = update_gift_log(room_id, gift_log_futures[room_id].result())
+                        gift_list_map, high_value_gift_ids, gift_list_error = gift_list_futures[room_id].result()
+                        if gift_list_error is not None:
+                            st.error(f"ルームID {room_id} のギフトリスト取得中にエラーが発生しました: {gift_list_error}")
 
-                        html_content = f"""
+                        # HTML は部品をリストに溜めて最後に一度だけ連結する
+                        parts = [f"""
                         <div class="room-container">
                             <div class="ranking-label" style="background-color: {rank_color};">{rank}位</div>
                             <div class="room-title">{room_name}</div>
                             <div class="gift-list-container">
-                        """
+                        """]
                         if not gift_list_map:
-                            html_content += '<p style="text-align: center; padding: 12px 0; color: orange;">ギフト情報取得失敗</p>'
+                            parts.append('<p style="text-align: center; padding: 12px 0; color: orange;">ギフト情報取得失敗</p>')
 
                         if gift_log:
-                            for log in gift_log:
-                                gift_id = log.get('gift_id')
-                                gift_info = gift_list_map.get(str(gift_id), {})
-                                gift_point = gift_info.get('point', 0)
-                                gift_count = log.get('num', 0)
-                                total_point = gift_point * gift_count
-                                highlight_class = ""
-                                if gift_point >= 500:
-                                    if total_point >= 300000: highlight_class = "highlight-300000"
-                                    elif total_point >= 100000: highlight_class = "highlight-100000"
-                                    elif total_point >= 60000: highlight_class = "highlight-60000"
-                                    elif total_point >= 30000: highlight_class = "highlight-30000"
-                                    elif total_point >= 10000: highlight_class = "highlight-10000"
-
-                                gift_image = log.get('image', gift_info.get('image', ''))
-                                html_content += (
-                                    f'<div class="gift-item {highlight_class}">'
-                                    f'<div class="gift-header"><small>{datetime.datetime.fromtimestamp(log.get("created_at", 0), JST).strftime("%H:%M:%S")}</small></div>'
-                                    f'<div class="gift-info-row"><img src="{gift_image}" class="gift-image" /><span>×{gift_count}</span></div>'
-                                    f'<div>{gift_point}pt</div></div>'
-                                )
-                            html_content += '</div>'
+                            parts.append(render_gift_items(room_id, gift_log, gift_list_map, high_value_gift_ids))
+                            parts.append('</div>')
                         else:
-                            html_content += '<p style="text-align: center; padding: 12px 0;">ギフト履歴がありません。</p></div>'
+                            parts.append('<p style="text-align: center; padding: 12px 0;">ギフト履歴がありません。</p></div>')
 
-                        html_content += '</div>'
-                        room_html_list.append(html_content)
-                html_container_content = '<div class="container-wrapper">' + ''.join(room_html_list) + '</div>'
-                gift_container.markdown(css_style + html_container_content, unsafe_allow_html=True)
+                        parts.append('</div>')
+                        room_html_list.append(''.join(parts))
+                gift_container.markdown(
+                    ''.join([GIFT_HISTORY_CSS, '<div class="container-wrapper">', *room_html_list, '</div>']),
+                    unsafe_allow_html=True
+                )
             else:
                 gift_container.info("選択されたルームに現在配信中のルームはありません。")
 
@@ -1512,26 +1974,28 @@ def main():
             if 'df' in locals() and not df.empty and 'ルーム名' in df.columns:
                 room_options_all = df['ルーム名'].tolist()
             else:
-                room_options_all = list(st.session_state.room_map_data.keys()) if st.session_state.room_map_data else []
+                room_options_all = st.session_state.room_map_data.index.tolist() if has_room_map else []
 
             if not room_options_all:
                 st.info("比較対象ルームが見つかりません。")
             else:
+                # ルームごとのループ内で session_state を引き直さないよう、ランキング表は一度だけ取り出す
+                room_map_data = st.session_state.room_map_data
                 room_rank_map = {}
                 df_rank_map = {}
                 if 'df' in locals() and not df.empty and 'ルーム名' in df.columns and '現在の順位' in df.columns:
-                    for _, row in df.iterrows():
-                        if pd.notna(row['現在の順位']):
+                    for rn, rank in zip(df['ルーム名'], df['現在の順位']):
+                        if pd.notna(rank):
                             try:
-                                df_rank_map[row['ルーム名']] = int(row['現在の順位'])
+                                df_rank_map[rn] = int(rank)
                             except:
-                                df_rank_map[row['ルーム名']] = row['現在の順位']
+                                df_rank_map[rn] = rank
 
                 for rn in room_options_all:
                     if rn in df_rank_map:
                         rank_display = f"{df_rank_map[rn]}位"
                     else:
-                        raw_rank = st.session_state.room_map_data.get(rn, {}).get("rank")
+                        raw_rank = room_map_data['rank'].get(rn)
                         try:
                             rank_int = int(raw_rank)
                             rank_display = f"{rank_int}位" if rank_int > 0 else "N/A"
@@ -1581,24 +2045,22 @@ def main():
                 points_map = {}
                 try:
                     if 'df' in locals() and not df.empty:
-                        for _, r in df.iterrows():
-                            rn = r.get('ルーム名')
-                            pval = r.get('現在のポイント')
+                        for rn, pval in zip(df['ルーム名'], df['現在のポイント']):
                             parsed = extract_int_from_mixed(pval)
                             if parsed is not None:
                                 points_map[rn] = int(parsed)
                             else:
                                 # fallback
                                 try:
-                                    points_map[rn] = int(st.session_state.room_map_data.get(rn, {}).get('point', 0) or 0)
+                                    points_map[rn] = int(room_map_data['point'].get(rn, 0) or 0)
                                 except:
                                     points_map[rn] = 0
                     else:
-                        for rn, info in st.session_state.room_map_data.items():
-                            points_map[rn] = int(info.get('point', 0) or 0)
+                        for rn, pt in room_map_data['point'].items():
+                            points_map[rn] = int(pt or 0)
                 except:
-                    for rn, info in st.session_state.room_map_data.items():
-                        points_map[rn] = int(info.get('point', 0) or 0)
+                    for rn, pt in room_map_data['point'].items():
+                        points_map[rn] = int(pt or 0)
 
                 if selected_enemy_room:
                     target_point = points_map.get(selected_target_room, 0)
@@ -1625,7 +2087,9 @@ def main():
                     except:
                         pass
                     if target_rank is None:
-                        target_rank = st.session_state.room_map_data.get(selected_target_room, {}).get('rank')
+                        target_rank = room_map_data['rank'].get(selected_target_room)
+                        if pd.isna(target_rank):
+                            target_rank = None
 
                     lower_gap_text = (
                         f"※下位とのポイント差: {target_lower_gap:,} pt"
@@ -1796,50 +2260,29 @@ def main():
 
             #if not is_aggregating and 'df' in locals() and not df.empty:
             if 'df' in locals() and not df.empty:
-                color_map = {row['ルーム名']: get_rank_color(row['現在の順位']) for index, row in df.iterrows()}
+                color_map = dict(zip(df['ルーム名'], get_rank_colors(df['現在の順位'])))
                 points_container = st.container()
 
                 with points_container:
-                    if '現在のポイント' in df.columns:
-                        # ✅ 集計中かどうかで使う列を切り替える
-                        y_col = "現在のポイント_numeric" if is_aggregating else "現在のポイント"
-                        fig_points = px.bar(
-                            df, x="ルーム名", y=y_col, title="各ルームの現在のポイント", color="ルーム名",
-                            color_discrete_map=color_map, hover_data=["現在の順位", "上位とのポイント差", "下位とのポイント差"],
-                            labels={y_col: "ポイント", "ルーム名": "ルーム名"}
-                        )
-                        st.plotly_chart(fig_points, use_container_width=True, key="points_chart")
-                        fig_points.update_layout(uirevision="const")
-
-                    if len(st.session_state.selected_room_names) > 1 and "上位とのポイント差" in df.columns:
-                        df['上位とのポイント差'] = pd.to_numeric(df['上位とのポイント差'], errors='coerce')
-                        fig_upper_gap = px.bar(
-                            df, x="ルーム名", y="上位とのポイント差", title="上位とのポイント差", color="ルーム名",
-                            color_discrete_map=color_map, hover_data=["現在の順位", "現在のポイント"],
-                            labels={"上位とのポイント差": "ポイント差", "ルーム名": "ルーム名"}
-                        )
-                        st.plotly_chart(fig_upper_gap, use_container_width=True, key="upper_gap_chart")
-                        fig_upper_gap.update_layout(uirevision="const")
-
-                    if len(st.session_state.selected_room_names) > 1 and "下位とのポイント差" in df.columns:
-                        df['下位とのポイント差'] = pd.to_numeric(df['下位とのポイント差'], errors='coerce')
-                        fig_lower_gap = px.bar(
-                            df, x="ルーム名", y="下位とのポイント差", title="下位とのポイント差", color="ルーム名",
-                            color_discrete_map=color_map, hover_data=["現在の順位", "現在のポイント"],
-                            labels={"下位とのポイント差": "ポイント差", "ルーム名": "ルーム名"}
-                        )
-                        st.plotly_chart(fig_lower_gap, use_container_width=True, key="lower_gap_chart")
-                        fig_lower_gap.update_layout(uirevision="const")
+                    # ✅ 集計中かどうかで使う列を切り替える
+                    y_col = "現在のポイント_numeric" if is_aggregating else "現在のポイント"
+                    # ポイント差のグラフは2ルーム以上選択時のみ（3つのグラフは1枚の Figure にまとめて描画）
+                    show_gaps = len(st.session_state.selected_room_names) > 1
+                    chart_cols = list(dict.fromkeys([
+                        "ルーム名", y_col, "現在の順位", "現在のポイント", "上位とのポイント差", "下位とのポイント差"
+                    ]))
+                    fig_dashboard = get_dashboard_figure(df[chart_cols], y_col, show_gaps, color_map)
+                    st.plotly_chart(fig_dashboard, use_container_width=True, key="dashboard_chart")
             else:
                 #st.markdown("<div style='margin-top: 16px;'></div>", unsafe_allow_html=True)
                 #st.info("ポイント集計中のためグラフは表示されません。")
                 pass
 
-
-            # 自動更新（7秒ごと）
-            st_autorefresh(interval=7000, limit=None, key="refresh")
+    if st.session_state.show_dashboard:
+        live_dashboard()
 
 
 
 if __name__ == "__main__":
+    start_event_prefetch()
     main()
\ No newline at end of file